@@ -1,7 +1,19 @@
 import streamlit as st
 import pandas as pd
-import PyPDF2
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pypdf import PdfReader
+from pdf_parsing import parse_pdf
+import io
+import hashlib
 import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+import zlib
 
 # --- APP CONFIGURATION ---
 st.set_page_config(
@@ -35,50 +47,270 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Max checklist items rendered at once; longer checklists are paginated
+CHECKLIST_PAGE_SIZE = 200
+# Number of best-matching pages shown in Chat mode
+CHAT_TOP_K = 3
+# Bound shared by the per-corpus search index caches (corpora kept, seconds)
+INDEX_CACHE_MAX_ENTRIES = 4
+INDEX_CACHE_TTL = 3600
+
 # --- DATA EXTRACTION ENGINE ---
-@st.cache_data
-def load_and_parse_pdfs(uploaded_files):
+# Heuristic patterns based on the documents provided (Steps, Checkboxes, Rules);
+# matched case-insensitively by Arrow's regex kernel at ingest
+ACTION_PATTERN = r"^(?:Step \d+|Action|☐|☑|✓|•|Rule \d+|Metric)"
+
+@st.cache_data(persist="disk")
+def load_and_parse_pdfs(file_names, file_digests, _files_bytes):
     """
-    Extracts text from uploaded PDFs and structures it into a DataFrame.
+    Extracts text from uploaded PDFs and structures it into two DataFrames.
     Ensures ZERO DATA LOSS by capturing full raw text.
+
+    Returns (lines_df, pages_df):
+    - lines_df: one row per non-empty line (File, Page, Line_Index, Content,
+      Content_lower, is_action)
+    - pages_df: one row per page (Page_Text_Z: zlib-compressed full page
+      text, read back with page_text), indexed by a sorted (File, Page)
+      MultiIndex for direct page lookups
     """
-    data = []
+    n_workers = min(8, len(file_names), os.cpu_count() or 1)
+    if n_workers > 1:
+        # spawn, not fork: forking the multi-threaded Streamlit server can deadlock
+        with ProcessPoolExecutor(
+            max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as ex:
+            parsed = list(ex.map(parse_pdf, _files_bytes, file_names))
+    else:
+        # A single file (or core) gains nothing from a worker process
+        parsed = [parse_pdf(b, name) for b, name in zip(_files_bytes, file_names)]
     
-    for uploaded_file in uploaded_files:
-        try:
-            pdf_reader = PyPDF2.PdfReader(uploaded_file)
-            file_name = uploaded_file.name
-            
-            for i, page in enumerate(pdf_reader.pages):
-                text = page.extract_text()
-                if text:
-                    # Clean slightly but keep raw content
-                    # We store line by line to help with granular search/checklists
-                    lines = text.split('\n')
-                    for line_idx, line in enumerate(lines):
-                        if line.strip(): # Skip empty lines
-                            data.append({
-                                "File": file_name,
-                                "Page": i + 1,
-                                "Line_Index": line_idx,
-                                "Content": line.strip(),
-                                "Full_Page_Text": text  # Store context
-                            })
-        except Exception as e:
-            st.error(f"Error reading {uploaded_file.name}: {e}")
+    for _, _, error in parsed:
+        if error:
+            st.error(error)
             
-    return pd.DataFrame(data)
+    # Arrow-backed strings keep text in contiguous buffers, so .str ops run
+    # in Arrow's compute kernels instead of per-object Python calls.
+    # File is categorical (one small int code per row, shared by both frames);
+    # Full page text is only ever read a few pages at a time, so it is kept
+    # zlib-compressed in pages_df (and in the on-disk cache).
+    file_dtype = pd.CategoricalDtype(list(file_names))
+    
+    # Fill preallocated columns file by file instead of building a record per
+    # page; File is built straight from category codes, with no type inference
+    counts = np.array([len(page_numbers) for page_numbers, _, _ in parsed], dtype=np.int64)
+    page_arr = np.empty(counts.sum(), dtype=np.int32)
+    text_arr = np.empty(counts.sum(), dtype=object)
+    offset = 0
+    for (page_numbers, page_texts, _), n in zip(parsed, counts):
+        page_arr[offset:offset + n] = page_numbers
+        text_arr[offset:offset + n] = page_texts
+        offset += n
+    file_codes = np.repeat(np.arange(len(file_names)), counts)
+    
+    pages = pd.DataFrame({
+        "File": pd.Categorical.from_codes(file_codes, dtype=file_dtype),
+        "Page": page_arr,
+        "Full_Page_Text": text_arr,
+    })
+    
+    # We store line by line to help with granular search/checklists:
+    # split every page at once and explode to one row per line. Line_Index is
+    # the position in the page's split (counted before empty lines are dropped)
+    lines_df = pages.assign(
+        Content=pages['Full_Page_Text'].str.split('\n')
+    ).drop(columns='Full_Page_Text').explode('Content')
+    lines_df['Line_Index'] = lines_df.groupby(level=0).cumcount()
+    lines_df = lines_df.reset_index(drop=True).astype({'Content': 'string[pyarrow]'})
+    lines_df['Content'] = lines_df['Content'].str.strip()
+    lines_df = lines_df.loc[
+        lines_df['Content'].str.len() > 0, ["File", "Page", "Line_Index", "Content"]
+    ].reset_index(drop=True)
+    
+    # Lowercase once here rather than on every case-insensitive query
+    lines_df['Content_lower'] = lines_df['Content'].str.lower()
+    # Flag checklist candidates once at ingest instead of on every render
+    lines_df['is_action'] = lines_df['Content'].str.match(ACTION_PATTERN, case=False).astype(bool)
+    pages_df = pages.assign(
+        Page_Text_Z=pages['Full_Page_Text'].map(lambda text: zlib.compress(text.encode('utf-8')))
+    ).drop(columns='Full_Page_Text').set_index(['File', 'Page']).sort_index()
+    return lines_df, pages_df
+
+def page_text(blob):
+    """Decompresses a Page_Text_Z value back into the full page text."""
+    return zlib.decompress(blob).decode('utf-8')
+
+def corpus_meta(pages_df):
+    """
+    Returns the documents with extracted text, in upload order.
+    """
+    return pages_df.index.unique(level='File').tolist()
+
+# --- LAZY PAGE ACCESS (READER) ---
+# Keyed on the file's digest (computed once per rerun); the bytes are passed
+# as an underscore argument so Streamlit doesn't re-hash them on every call.
+@st.cache_resource(max_entries=16, ttl=3600)
+def open_pdf(file_digest, _file_bytes):
+    """
+    Opens a PDF once per file content; pages are only parsed when read.
+    Returns (reader, lock): cached resources are shared across sessions and
+    a pypdf reader must not be used from two threads at once.
+    """
+    return PdfReader(io.BytesIO(_file_bytes)), threading.Lock()
+
+def page_count(file_digest, file_bytes):
+    """Number of pages in the PDF (reads the page tree, not page contents)."""
+    pdf_reader, lock = open_pdf(file_digest, file_bytes)
+    with lock:
+        return len(pdf_reader.pages)
+
+@st.cache_data(max_entries=256)
+def get_page_text(file_digest, page_no, _file_bytes):
+    """
+    Extracts the text of a single page on demand, so the Reader never waits
+    for the whole corpus to be ingested. Keeps the 256 most recent pages.
+    """
+    pdf_reader, lock = open_pdf(file_digest, _file_bytes)
+    with lock:
+        return pdf_reader.pages[page_no - 1].extract_text() or ""
+
+# --- SEARCH INDEX ---
+def lower_text(text):
+    """
+    Lowercases a query with Arrow's utf8_lower, the same kernel that built
+    Content_lower and the index tokens. Python's str.lower differs on some
+    letters (e.g. Greek final sigma, 'İ'), which would make matches miss.
+    """
+    return pc.utf8_lower(pa.scalar(text, type=pa.string())).as_py()
+
+# The index caches below are keyed on corpus_key (file names + content
+# digests) and take the frames as underscore arguments, which Streamlit does
+# not hash; hashing every row of the frames on each keystroke would cost
+# more than the scan the index replaces.
+@st.cache_resource(max_entries=INDEX_CACHE_MAX_ENTRIES, ttl=INDEX_CACHE_TTL)
+def build_index(corpus_key, _lines_df):
+    """
+    Builds an inverted index: lowercase word token -> sorted row positions
+    of the lines in lines_df that contain it.
+    Built once per corpus so queries become dictionary lookups, not scans.
+    Postings are stored as presorted int32 arrays so lookups can merge and
+    take from them directly, without converting Python lists per query.
+    """
+    index = defaultdict(list)
+    for row_pos, content in enumerate(_lines_df['Content_lower']):
+        for token in set(re.findall(r"\w+", content)):
+            index[token].append(row_pos)
+    return {token: np.array(postings, dtype=np.int32) for token, postings in index.items()}
+
+def line_page_ids(lines_df, pages_df):
+    """
+    Maps every row of lines_df to the row position of its page in pages_df.
+    """
+    return pages_df.index.get_indexer(pd.MultiIndex.from_frame(lines_df[['File', 'Page']]))
+
+@st.cache_resource(max_entries=INDEX_CACHE_MAX_ENTRIES, ttl=INDEX_CACHE_TTL)
+def build_page_index(corpus_key, _lines_df, _pages_df):
+    """
+    Page-level view of the inverted index: word token -> unique row positions
+    of the pages in pages_df that contain it.
+    Precomputed once so Chat scoring never re-maps line postings per query.
+    """
+    index = build_index(corpus_key, _lines_df)
+    page_ids = line_page_ids(_lines_df, _pages_df)
+    return {
+        token: np.unique(page_ids[postings]).astype(np.int32)
+        for token, postings in index.items()
+    }
+
+@st.cache_resource(max_entries=INDEX_CACHE_MAX_ENTRIES, ttl=INDEX_CACHE_TTL)
+def build_vocabulary(corpus_key, _lines_df):
+    """
+    All distinct tokens of the inverted index as a Series, so query words can
+    be matched against the whole vocabulary in one vectorized str.contains.
+    """
+    return pd.Series(list(build_index(corpus_key, _lines_df)), dtype='string[pyarrow]')
+
+def token_postings(index, vocab, query_token):
+    """
+    Returns the sorted, unique postings (line or page positions) of all
+    entries containing query_token.
+    The token is matched as a substring of indexed words, so partial words
+    (e.g. 'dopa') still find 'dopamine', like the plain text search did.
+    """
+    matched = vocab[vocab.str.contains(query_token, regex=False)]
+    if matched.empty:
+        return np.empty(0, dtype=np.int32)
+    if len(matched) == 1:
+        # Already sorted and unique: no merge needed
+        return index[matched.iloc[0]]
+    return np.unique(np.concatenate([index[token] for token in matched]))
+
+def query_postings(index, vocab, query_tokens):
+    """
+    Returns token_postings for every query word, in query_tokens order.
+    A single alternation-regex pass over the vocabulary first narrows it to
+    words containing any query word, so the per-word matching only runs on
+    that small subset instead of rescanning the whole vocabulary per word.
+    """
+    if not query_tokens:
+        return []
+    any_token = "|".join(re.escape(token) for token in query_tokens)
+    candidates = vocab[vocab.str.contains(any_token, regex=True)]
+    return [token_postings(index, candidates, token) for token in query_tokens]
+
+def lookup_lines(index, vocab, query):
+    """
+    Returns sorted row positions of the lines that contain every word of the
+    query, or None when the query has no word characters to look up.
+    """
+    query_tokens = set(re.findall(r"\w+", lower_text(query)))
+    if not query_tokens:
+        return None
+    
+    candidates = None
+    for hits in query_postings(index, vocab, list(query_tokens)):
+        candidates = hits if candidates is None else np.intersect1d(candidates, hits, assume_unique=True)
+        if candidates.size == 0:
+            break
+    return candidates
+
+def compile_search_pattern(query):
+    """
+    Builds a case-insensitive literal pattern for the search query.
+    """
+    return re.compile(re.escape(query), re.IGNORECASE)
 
 def extract_action_items(df):
     """
     Heuristic parser to identify 'Actionable' items for the Checklist Mode.
     Looks for keywords common in your PDFs: 'Step', 'Action', 'Checklist', '☐', '☑'
+    The ACTION_PATTERN match is precomputed into the 'is_action' column at ingest.
     """
-    # Regex patterns based on the documents provided (Steps, Checkboxes, Rules)
-    pattern = r"^(Step \d+|Action|☐|☑|✓|•|Rule \d+|Metric)"
-    
-    actions = df[df['Content'].str.contains(pattern, case=False, regex=True)].copy()
-    return actions
+    return df[df['is_action']]
+
+def unique_display_names(names):
+    """
+    Gives same-named uploads (e.g. two 'notes.pdf' from different folders)
+    distinct names like 'notes.pdf (2)', so every file stays loaded and the
+    (File, Page) keys stay unique.
+    """
+    used = set()
+    display_names = []
+    for name in names:
+        candidate, n = name, 1
+        while candidate in used:
+            n += 1
+            candidate = f"{name} ({n})"
+        used.add(candidate)
+        display_names.append(candidate)
+    return display_names
+
+def remember_tick(key):
+    """
+    Copies a checklist checkbox's state into st.session_state.checked.
+    Streamlit drops the state of widgets that are not rendered, so ticks on
+    other checklist pages would otherwise be lost when paginating.
+    """
+    st.session_state.checked[key] = st.session_state[key]
 
 # --- MAIN APP LOGIC ---
 
@@ -102,18 +334,28 @@ def main():
         st.markdown("* **Ask:** Get verbatim snippets based on your queries.")
         return
 
-    # Process Data
-    with st.spinner("Ingesting Knowledge Base..."):
-        df = load_and_parse_pdfs(uploaded_files)
-        if df.empty:
-            st.error("Could not extract text. Please check if PDFs are text-based (not scanned images).")
-            return
-            
+    files_bytes = tuple(f.getvalue() for f in uploaded_files)
+    file_names = tuple(unique_display_names(f.name for f in uploaded_files))
+    # Content digests, computed once per rerun: cheap, hashable cache keys
+    # for the index caches (whole corpus) and the Reader caches (per file)
+    file_digests = tuple(hashlib.sha1(b).hexdigest() for b in files_bytes)
+    corpus_key = (file_names, file_digests)
+
     # Sidebar Navigation
     mode = st.sidebar.radio("Select Mode", ["📖 Reader", "🔍 Global Search", "✅ Interactive Checklist", "💬 Chat/Query"])
     
     st.sidebar.markdown("---")
-    st.sidebar.success(f"Loaded {len(df)} lines of text from {len(uploaded_files)} files.")
+
+    # Process Data (Reader extracts pages on demand and skips full ingestion)
+    if mode != "📖 Reader":
+        with st.spinner("Ingesting Knowledge Base..."):
+            lines_df, pages_df = load_and_parse_pdfs(file_names, file_digests, files_bytes)
+            if lines_df.empty:
+                st.error("Could not extract text. Please check if PDFs are text-based (not scanned images).")
+                return
+                
+        files = corpus_meta(pages_df)
+        st.sidebar.success(f"Loaded {len(lines_df)} lines of text from {len(uploaded_files)} files.")
 
     # --- MODE 1: READER ---
     if mode == "📖 Reader":
@@ -121,16 +363,25 @@ def main():
         
         col1, col2 = st.columns([1, 3])
         with col1:
-            selected_file = st.selectbox("Select Document", df['File'].unique())
+            selected_file = st.selectbox("Select Document", file_names)
             
-        file_data = df[df['File'] == selected_file]
-        max_page = int(file_data['Page'].max())
+        file_pos = file_names.index(selected_file)
+        file_digest, file_bytes = file_digests[file_pos], files_bytes[file_pos]
+        try:
+            max_page = max(1, page_count(file_digest, file_bytes))
+        except Exception as e:
+            st.error(f"Error reading {selected_file}: {e}")
+            return
         
         with col1:
             page_num = st.number_input("Go to Page", min_value=1, max_value=max_page, value=1)
             
-        # Display Content
-        page_content = file_data[file_data['Page'] == page_num]['Full_Page_Text'].iloc[0]
+        # Display Content (only this page is extracted)
+        try:
+            page_content = get_page_text(file_digest, page_num, file_bytes)
+        except Exception as e:
+            st.error(f"Error reading {selected_file} page {page_num}: {e}")
+            page_content = ""
         
         st.markdown("---")
         st.markdown(f"**{selected_file} - Page {page_num}**")
@@ -142,45 +393,77 @@ def main():
         query = st.text_input("Search for any keyword (e.g., 'Dopamine', 'Step 1', 'Focus')")
         
         if query:
-            # Case-insensitive search
-            results = df[df['Content'].str.contains(query, case=False, regex=False)]
+            # Narrow down to lines holding every query word via the index,
+            # then run the case-insensitive match only on that subset
+            candidates = lookup_lines(
+                build_index(corpus_key, lines_df), build_vocabulary(corpus_key, lines_df), query
+            )
+            subset = lines_df if candidates is None else lines_df.iloc[candidates]
+            
+            # Literal match straight in Arrow's kernel, bypassing the .str accessor;
+            # matching the pre-lowercased column avoids a case-folding regex
+            content = pa.array(subset['Content_lower'].array)
+            mask = np.asarray(pc.match_substring(content, lower_text(query)), dtype=bool)
+            results = subset.iloc[mask]
+            
+            # Highlight the term (any casing) on the matched lines only; a
+            # template replacement avoids a Python callback per match
+            pattern = compile_search_pattern(query)
             
             st.markdown(f"Found **{len(results)}** matches.")
             
-            for index, row in results.iterrows():
-                with st.expander(f"Found in {row['File']} (Page {row['Page']})"):
-                    # Highlight the term
-                    highlighted_text = row['Content'].replace(query, f"**{query}**")
-                    highlighted_text = highlighted_text.replace(query.lower(), f"**{query}**")
-                    highlighted_text = highlighted_text.replace(query.capitalize(), f"**{query}**")
-                    
+            for row in results.itertuples(index=False):
+                highlighted_text = pattern.sub(r"**\g<0>**", row.Content)
+                with st.expander(f"Found in {row.File} (Page {row.Page})"):
                     st.markdown(f"> ... {highlighted_text} ...")
-                    st.caption(f"Line {row['Line_Index']}")
+                    st.caption(f"Line {row.Line_Index}")
 
     # --- MODE 3: INTERACTIVE CHECKLIST ---
     elif mode == "✅ Interactive Checklist":
         st.header("✅ Generated Productivity Tracker")
         st.info("The app automatically identified these actionable steps from your documents.")
         
-        actions = extract_action_items(df)
+        actions = extract_action_items(lines_df)
         
         # Filter by file
-        filter_file = st.selectbox("Filter by Source", ["All"] + list(df['File'].unique()))
+        filter_file = st.selectbox("Filter by Source", ["All"] + files)
         if filter_file != "All":
             actions = actions[actions['File'] == filter_file]
 
-        # Display as checkboxes
-        for index, row in actions.iterrows():
-            # Create a unique key for session state
-            key = f"{row['File']}_{row['Page']}_{row['Line_Index']}"
-            
+        # Pre-build (key, markdown) pairs; only the checkbox is a per-row widget
+        items = [
+            (
+                f"{row.File}_{row.Page}_{row.Line_Index}", # Unique key for session state
+                f"**{row.Content}**  \n*Source: {row.File} | Page {row.Page}*"
+            )
+            for row in actions.itertuples(index=False)
+        ]
+        
+        # Paginate long checklists to keep the number of rendered widgets bounded
+        if len(items) > CHECKLIST_PAGE_SIZE:
+            n_pages = -(-len(items) // CHECKLIST_PAGE_SIZE)
+            if st.session_state.get("checklist_page", 1) > n_pages:
+                st.session_state.checklist_page = n_pages
+            page = st.number_input(
+                f"Checklist page (of {n_pages})",
+                min_value=1, max_value=n_pages, key="checklist_page"
+            )
+            offset = (page - 1) * CHECKLIST_PAGE_SIZE
+            items = items[offset:offset + CHECKLIST_PAGE_SIZE]
+
+        # Display as checkboxes (ticks live in session_state.checked so they
+        # survive while their page of the checklist is not rendered)
+        checked = st.session_state.setdefault("checked", {})
+        for key, md_text in items:
             col1, col2 = st.columns([0.05, 0.95])
             with col1:
                 # Actual interactive checkbox
-                st.checkbox("", key=key)
+                st.checkbox(
+                    "", key=key, value=checked.get(key, False),
+                    on_change=remember_tick, args=(key,)
+                )
             with col2:
-                st.markdown(f"**{row['Content']}**")
-                st.caption(f"Source: {row['File']} | Page {row['Page']}")
+                st.markdown(md_text)
             st.divider()
 
     # --- MODE 4: CHAT / QUERY ---
@@ -191,36 +474,35 @@ def main():
         user_query = st.text_input("Query (e.g., 'What is the 5 second rule?')")
         
         if user_query:
-            # Simple relevance scoring: Count occurrence of query words in the page text
-            # We search against full pages to give context
-            unique_pages = df[['File', 'Page', 'Full_Page_Text']].drop_duplicates()
-            
-            results = []
-            query_tokens = user_query.lower().split()
+            # Simple relevance scoring: Count how many query words appear on each page
+            # Pages come from the page-level postings of each word in the index
+            page_index = build_page_index(corpus_key, lines_df, pages_df)
+            vocab = build_vocabulary(corpus_key, lines_df)
+            query_tokens = list(set(re.findall(r"\w+", lower_text(user_query))))
             
-            for index, row in unique_pages.iterrows():
-                score = 0
-                text_lower = row['Full_Page_Text'].lower()
-                for token in query_tokens:
-                    if token in text_lower:
-                        score += 1
-                
-                if score > 0:
-                    results.append({
-                        "File": row['File'],
-                        "Page": row['Page'],
-                        "Text": row['Full_Page_Text'],
-                        "Score": score
-                    })
+            # Each word contributes at most 1 per page (presence scoring)
+            matched_pages = query_postings(page_index, vocab, query_tokens)
+            scores = np.bincount(
+                np.concatenate(matched_pages or [np.empty(0, dtype=np.int32)]),
+                minlength=len(pages_df)
+            )
             
-            # Sort by score
-            results = sorted(results, key=lambda x: x['Score'], reverse=True)
+            # Pick the top pages with a partial selection instead of a full sort.
+            # The key ranks by score, then by page order, so ties at the cut-off
+            # keep the earliest pages (same result as a stable sort)
+            hit_ids = np.flatnonzero(scores)
+            rank_key = scores[hit_ids].astype(np.int64) * len(pages_df) - hit_ids
+            if hit_ids.size > CHAT_TOP_K:
+                top = np.argpartition(-rank_key, CHAT_TOP_K - 1)[:CHAT_TOP_K]
+            else:
+                top = np.arange(hit_ids.size)
+            top_ids = hit_ids[top[np.argsort(-rank_key[top])]]
             
-            if results:
-                st.success(f"Found relevant content in {len(results)} pages.")
-                for res in results[:3]: # Show top 3 results
-                    st.markdown(f"### From: {res['File']} (Page {res['Page']})")
-                    st.info(res['Text'])
+            if hit_ids.size:
+                st.success(f"Found relevant content in {hit_ids.size} pages.")
+                for (file_name, page_no), blob in pages_df['Page_Text_Z'].iloc[top_ids].items():
+                    st.markdown(f"### From: {file_name} (Page {page_no})")
+                    st.info(page_text(blob))
                     st.markdown("---")
             else:
                 st.warning("No exact matches found. Try using simpler keywords.")
@@ -0,0 +1,28 @@
+from pypdf import PdfReader
+import io
+
+# Kept out of app.py so ProcessPoolExecutor workers can import it: Streamlit
+# runs app.py as __main__, which spawned worker processes cannot unpickle from.
+
+def parse_pdf(file_bytes, file_name):
+    """
+    Parses a single PDF into (page_numbers, page_texts, error), covering
+    only pages with extractable text.
+    Runs in a worker process, so errors are returned rather than shown here.
+    """
+    page_numbers = []
+    page_texts = []
+    
+    try:
+        pdf_reader = PdfReader(io.BytesIO(file_bytes))
+        
+        for i, page in enumerate(pdf_reader.pages):
+            text = page.extract_text()
+            if text:
+                page_numbers.append(i + 1)
+                page_texts.append(text)
+    except Exception as e:
+        # Keep whatever pages were read before the failure
+        return page_numbers, page_texts, f"Error reading {file_name}: {e}"
+    
+    return page_numbers, page_texts, None